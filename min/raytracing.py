@@ -8,59 +8,593 @@
 #import os
 #import sys
 #import pdb
+from math import isnan, cos, sin
 
 # Scipy and related imports
 import numpy as np
-import scipy.linalg as lin
 
-def propagate_rays(components, rays, lmb=525e-9):
+# Numba is optional. Without it rays are propagated with plain numpy
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        '''
+            Stand-in for numba.njit which returns the function untouched
+        '''
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# CuPy is optional as well. Large mirror-only systems are sent to the GPU
+try:
+    import cupy as cp
+    HAS_CUPY = True
+except ImportError:
+    HAS_CUPY = False
+
+# Fast math flags for the compiled kernels. NaN and inf are left out since
+# terminated rays are marked with NaN
+_FASTMATH = {'contract', 'arcp', 'nsz', 'afn', 'reassoc'}
+
+# Minimum number of ray-component steps before the GPU is worth the transfer
+GPU_THRESHOLD = 100000
+
+# CUDA kernel for propagate_rays_gpu, compiled on first use
+_GPU_KERNEL = None
+
+# Integer tags for component types which have a compiled kernel
+KIND_MIRROR = 0
+_KIND_CODES = {'mirror': KIND_MIRROR}
+
+def propagate_rays(components, rays, lmb=525e-9, dtype=None,
+                   workspace=None, use_gpu=False):
     '''
         Function to propagate rays through a set of components
 
         Inputs:
-            components: List of optical components
+            components: List of optical components, or an OpticalSystem
+                built from them
             rays: List of 3-tuple of rays with x-coord, y-coord and angle
             lmb: Wavelength of rays in m. Default if 525nm
+            dtype: Floating point type of the output. If None, the type of
+                the workspace is used, or np.float32 without a workspace.
+                Single precision is plenty for drawing; use np.float64 for
+                precise computations
+            workspace: PropagationWorkspace whose buffer is used for the
+                output. If None, a new array is allocated
+            use_gpu: If True, cupy is available and the system has only
+                mirrors, systems with at least GPU_THRESHOLD ray-component
+                steps are propagated on the GPU with propagate_rays_gpu
 
         Outputs:
-            ray_bundles: For N components, this is a list of 3x(N+1) coordinates
-                of rays propagated through the components.
+            ray_bundles: For N rays and C components, this is a 3xNx(C+1)
+                array of coordinates of rays propagated through the
+                components. ray_bundles[:, idx, :] is the path of ray idx.
+                With a workspace, this is the workspace buffer, which is
+                overwritten by the next call using the same workspace.
     '''
+    if isinstance(components, OpticalSystem):
+        system = components
+    else:
+        system = OpticalSystem(components)
+
     # Create output ray first
-    ncomponents = len(components)
+    ncomponents = len(system.components)
     nrays = len(rays)
-    ray_bundles = []
+    if workspace is None:
+        if dtype is None:
+            dtype = np.float32
+        ray_bundles = np.empty((3, nrays, ncomponents+1), dtype=dtype)
+    else:
+        ray_bundles = workspace.reset(nrays, ncomponents, dtype)
+        dtype = ray_bundles.dtype
 
-    for idx in range(nrays):
-        ray_bundles.append(np.zeros((3, ncomponents+1)))
-        ray_bundles[idx][:, 0] = rays[idx]
+    # Large mirror-only systems go to the GPU if asked for
+    if use_gpu and HAS_CUPY and system.mirror_only and \
+            nrays*ncomponents >= GPU_THRESHOLD:
+        return propagate_rays_gpu(system, rays, lmb, dtype, out=ray_bundles)
 
-    # Now propagate each ray through each component
-    for r_idx in range(nrays):
-        for c_idx in range(1, ncomponents+1):
-            ray_bundles[r_idx][:, c_idx] = components[c_idx-1].propagate(
-                                            ray_bundles[r_idx][:, c_idx-1],
-                                            lmb).reshape(3,)
+    ray_bundles[:, :, 0] = np.asarray(rays, dtype=dtype).reshape(nrays, 3).T
+
+    # Now propagate all rays through each component at once
+    system.propagate(ray_bundles, lmb)
 
     # Done, return
     return ray_bundles
 
+# CUDA kernel for propagate_rays_gpu. Each thread walks one ray through all
+# the mirrors, keeping the ray in registers
+_GPU_MIRROR_SOURCE = r'''
+extern "C" __global__
+void propagate_mirrors(const double* H, const double* Hinv,
+                       const double* theta, const double* half_aperture,
+                       double* ray_bundles, const int nrays,
+                       const int ncomponents)
+{
+    const double PI = 3.141592653589793;
+    const int r_idx = blockDim.x*blockIdx.x + threadIdx.x;
+
+    if (r_idx >= nrays)
+        return;
+
+    // ray_bundles is a row-major 3xNx(C+1) array
+    const int stride = nrays*(ncomponents + 1);
+    double* xs = ray_bundles + r_idx*(ncomponents + 1);
+    double* ys = xs + stride;
+    double* ths = ys + stride;
+
+    double x = xs[0];
+    double y = ys[0];
+    double th = ths[0];
+    bool valid = true;
+
+    for (int c_idx = 0; c_idx < ncomponents; c_idx++)
+    {
+        // Ray terminated at a previous mirror
+        if (!valid)
+        {
+            xs[c_idx+1] = nan("");
+            ys[c_idx+1] = nan("");
+            ths[c_idx+1] = nan("");
+            continue;
+        }
+
+        const double* h = H + 9*c_idx;
+        const double* hi = Hinv + 9*c_idx;
+
+        // Intersection with the mirror plane in mirror coordinates. The ray
+        // travels t = -px/cos along its direction to reach x=0
+        const double px = h[0]*x + h[1]*y + h[2];
+        const double py = h[3]*x + h[4]*y + h[5];
+        double s, c;
+        sincos(th + theta[c_idx], &s, &c);
+        const double y_new = py - px*s/c;
+
+        valid = fabs(y_new) <= half_aperture[c_idx];
+
+        // Go back to original system
+        x = hi[1]*y_new + hi[2];
+        y = hi[4]*y_new + hi[5];
+
+        // Deflection angle, wrapped between -pi and pi
+        th = fmod(2*PI - th - 2*theta[c_idx], 2*PI);
+        if (th < 0)
+            th += 2*PI;
+        th -= PI;
+
+        xs[c_idx+1] = x;
+        ys[c_idx+1] = y;
+        ths[c_idx+1] = valid ? th : nan("");
+    }
+}
+'''
+
+def propagate_rays_gpu(components, rays, lmb=525e-9, dtype=np.float32,
+                       out=None):
+    '''
+        Function to propagate rays through a set of mirrors on the GPU. Needs
+        CuPy.
+
+        Inputs:
+            components: List of Mirror objects, or an OpticalSystem built
+                from them
+            rays: List of 3-tuple of rays with x-coord, y-coord and angle
+            lmb: Wavelength of rays in m. Not needed for mirrors, kept for
+                same signature as propagate_rays
+            dtype: Floating point type of the output. The kernel computes in
+                double precision and converts on the device before download
+            out: Optional 3xNx(C+1) host array of type dtype to download
+                into. If None, a new array is allocated
+
+        Outputs:
+            ray_bundles: 3xNx(C+1) array of coordinates of rays propagated
+                through the components, same as propagate_rays.
+    '''
+    if not HAS_CUPY:
+        raise ImportError("propagate_rays_gpu needs cupy")
+
+    if isinstance(components, OpticalSystem):
+        system = components
+    else:
+        system = OpticalSystem(components)
+
+    ncomponents = len(system.components)
+    nrays = len(rays)
+
+    # Upload all mirror parameters once
+    H = cp.asarray(system.H_all)
+    Hinv = cp.asarray(system.Hinv_all)
+    theta = cp.asarray(system.theta_all)
+    half_aperture = cp.asarray(system.half_aperture_all)
+
+    ray_bundles = cp.empty((3, nrays, ncomponents+1), dtype=cp.float64)
+    ray_bundles[:, :, 0] = cp.asarray(np.asarray(rays, dtype=np.float64)
+                                        .reshape(nrays, 3).T)
+
+    global _GPU_KERNEL
+    if _GPU_KERNEL is None:
+        _GPU_KERNEL = cp.RawKernel(_GPU_MIRROR_SOURCE, 'propagate_mirrors')
+
+    nthreads = 128
+    nblocks = (nrays + nthreads - 1)//nthreads
+    _GPU_KERNEL((nblocks,), (nthreads,),
+                (H, Hinv, theta, half_aperture, ray_bundles,
+                 np.int32(nrays), np.int32(ncomponents)))
+
+    # Single download at the end
+    if out is None:
+        return cp.asnumpy(ray_bundles.astype(dtype, copy=False))
+
+    ray_bundles.astype(dtype, copy=False).get(out=out)
+
+    return out
+
+@njit(cache=True, fastmath=_FASTMATH, error_model='numpy')
+def _mat3_mul_vec3(H, x, y):
+    '''
+        Function to apply a flattened 3x3 affine transformation matrix to the
+        point (x, y, 1)
+
+        Inputs:
+            H: Flattened 3x3 transformation matrix
+            x, y: Coordinates of the point
+
+        Outputs:
+            x_out, y_out: Coordinates of the transformed point
+    '''
+    return H[0]*x + H[1]*y + H[2], H[3]*x + H[4]*y + H[5]
+
+@njit(cache=True, fastmath=_FASTMATH, error_model='numpy')
+def _step_mirror(x, y, th, H, Hinv, mirror_theta, pi_minus_2theta,
+                 half_aperture):
+    '''
+        Function to propagate a single ray through a mirror. Intersection and
+        deflection are done together, with all intermediates kept as scalars
+
+        Inputs:
+            x, y, th: x-coordinate, y-coordinate and angle (rad) of the ray
+            H: Flattened 3x3 transformation matrix of the mirror
+            Hinv: Flattened inverse transformation matrix of the mirror
+            mirror_theta: Inclination of the mirror w.r.t Y axis
+            pi_minus_2theta: pi - 2*mirror_theta, precomputed
+            half_aperture: Half of the aperture of the mirror
+
+        Outputs:
+            x_out, y_out, th_out: Ray after propagation through the mirror
+            valid: 1.0 if the ray hit the mirror, 0.0 otherwise
+    '''
+    # If theta is nan, it means the ray terminated
+    if isnan(th):
+        return np.nan, np.nan, np.nan, 0.0
+
+    # Transform ray origin to mirror coordinates
+    px, py = _mat3_mul_vec3(H, x, y)
+
+    # Intersection with the mirror plane, which is x=0 in mirror coordinates.
+    # The ray travels t = -px/cos along its direction to get there
+    costh = cos(th + mirror_theta)
+    sinth = sin(th + mirror_theta)
+    y_new = py - px*sinth/costh
+
+    if abs(y_new) <= half_aperture:
+        valid = 1.0
+    else:
+        valid = 0.0
+
+    # Go back to original system
+    x_out, y_out = _mat3_mul_vec3(Hinv, 0.0, y_new)
+
+    # Deflection angle
+    th_out = _angle_wrap(pi_minus_2theta - th)
+
+    return x_out, y_out, th_out, valid
+
+@njit(parallel=True, fastmath=_FASTMATH, error_model='numpy',
+      cache=True)
+def _propagate_kernel(ray_bundles, H_all, Hinv_all, theta_all,
+                      pi_minus_2theta_all, half_aperture_all, kind_all):
+    '''
+        Function to propagate rays through a set of components in place.
+        Rays are independent, so for each component they are split across
+        threads
+
+        Inputs:
+            ray_bundles: 3xNx(C+1) array with the input rays in the first
+                column. Remaining columns are filled with propagated rays
+            H_all: Cx9 array of flattened transformation matrices
+            Hinv_all: Cx9 array of flattened inverse transformation matrices
+            theta_all: C inclinations of the components
+            pi_minus_2theta_all: C values of pi - 2*theta
+            half_aperture_all: C half apertures of the components
+            kind_all: C integer tags of the component types
+
+        Outputs:
+            None.
+    '''
+    nrays = ray_bundles.shape[1]
+    ncomponents = H_all.shape[0]
+
+    # Rays which have not terminated yet
+    valid = np.ones(nrays, dtype=np.bool_)
+
+    # Components in the outer loop, so each component's parameters are
+    # loaded once and stay hot across all the rays
+    for c_idx in range(ncomponents):
+        H = H_all[c_idx]
+        Hinv = Hinv_all[c_idx]
+        theta = theta_all[c_idx]
+        pi_minus_2theta = pi_minus_2theta_all[c_idx]
+        half_aperture = half_aperture_all[c_idx]
+        kind = kind_all[c_idx]
+
+        for r_idx in prange(nrays):
+            # Ray terminated at a previous component
+            if not valid[r_idx]:
+                ray_bundles[0, r_idx, c_idx+1] = np.nan
+                ray_bundles[1, r_idx, c_idx+1] = np.nan
+                ray_bundles[2, r_idx, c_idx+1] = np.nan
+                continue
+
+            x = ray_bundles[0, r_idx, c_idx]
+            y = ray_bundles[1, r_idx, c_idx]
+            th = ray_bundles[2, r_idx, c_idx]
+
+            if kind == KIND_MIRROR:
+                x, y, th, flag = _step_mirror(x, y, th, H, Hinv, theta,
+                                              pi_minus_2theta, half_aperture)
+            else:
+                # Kinds without a kernel are sent to the numpy path by
+                # OpticalSystem, so this only guards against misuse
+                flag = 0.0
+
+            ray_bundles[0, r_idx, c_idx+1] = x
+            ray_bundles[1, r_idx, c_idx+1] = y
+            if flag == 1.0:
+                ray_bundles[2, r_idx, c_idx+1] = th
+            else:
+                ray_bundles[2, r_idx, c_idx+1] = np.nan
+                valid[r_idx] = False
+
+# Kernels specialized to a mirror-only system, keyed by mirror parameters
+_SCENE_KERNELS = {}
+
+_SCENE_HEADER = '''
+def _scene_kernel(ray_bundles):
+    for r_idx in prange(ray_bundles.shape[1]):
+        x = ray_bundles[0, r_idx, 0]
+        y = ray_bundles[1, r_idx, 0]
+        th = ray_bundles[2, r_idx, 0]
+        valid = 1.0
+'''
+
+_SCENE_STEP = '''
+        if valid == 1.0:
+            x, y, th, valid = _step_mirror(x, y, th, {H}, {Hinv}, {theta},
+                                           {pi_minus_2theta},
+                                           {half_aperture})
+            ray_bundles[0, r_idx, {col}] = x
+            ray_bundles[1, r_idx, {col}] = y
+            ray_bundles[2, r_idx, {col}] = th if valid == 1.0 else np.nan
+        else:
+            ray_bundles[0, r_idx, {col}] = np.nan
+            ray_bundles[1, r_idx, {col}] = np.nan
+            ray_bundles[2, r_idx, {col}] = np.nan
+'''
+
+def _float_literal(val):
+    '''
+        Function to write a float as Python source which evaluates to the
+        exact same value
+    '''
+    if np.isfinite(val):
+        return repr(float(val))
+    elif np.isnan(val):
+        return 'np.nan'
+    elif val > 0:
+        return 'np.inf'
+    else:
+        return '-np.inf'
+
+def _get_scene_kernel(system):
+    '''
+        Function to get a kernel specialized to a mirror-only system. The
+        parameters of every mirror are written into the kernel source as
+        literals and the mirror loop is unrolled, so that the compiler can
+        fold the constants. Kernels are generated once per set of mirror
+        parameters.
+
+        Inputs:
+            system: OpticalSystem with mirrors only
+
+        Outputs:
+            kernel: Compiled function which takes a 3xNx(C+1) ray bundle
+                and fills it in place, like _propagate_kernel
+    '''
+    key = (system.H_all.tobytes(), system.Hinv_all.tobytes(),
+           system.theta_all.tobytes(), system.half_aperture_all.tobytes())
+
+    if key in _SCENE_KERNELS:
+        return _SCENE_KERNELS[key]
+
+    source = _SCENE_HEADER
+    for c_idx in range(len(system.components)):
+        H = ', '.join(_float_literal(val) for val in system.H_all[c_idx])
+        Hinv = ', '.join(_float_literal(val)
+                         for val in system.Hinv_all[c_idx])
+
+        source += _SCENE_STEP.format(
+                    H='(%s)'%H,
+                    Hinv='(%s)'%Hinv,
+                    theta=_float_literal(system.theta_all[c_idx]),
+                    pi_minus_2theta=_float_literal(
+                                    system.pi_minus_2theta_all[c_idx]),
+                    half_aperture=_float_literal(
+                                    system.half_aperture_all[c_idx]),
+                    col=c_idx+1)
+
+    namespace = {'np': np, 'prange': prange, '_step_mirror': _step_mirror}
+    exec(source, namespace)
+
+    kernel = njit(parallel=True, fastmath=_FASTMATH,
+                  error_model='numpy')(namespace['_scene_kernel'])
+    _SCENE_KERNELS[key] = kernel
+
+    return kernel
+
 def angle_wrap(angle):
     '''
         Wrap angle between -180 to 180
 
         Inputs:
-            angle: In radians
+            angle: In radians. Can be a scalar or an array
 
         Outputs:
             wrapped_angle: In radians
     '''
-    if angle > np.pi:
-        angle -= 2*np.pi
-    elif angle < -np.pi:
-        angle += 2*np.pi
+    return (angle + np.pi) % (2*np.pi) - np.pi
+
+# Compiled version for use inside the propagation kernels
+_angle_wrap = njit(cache=True, fastmath=_FASTMATH,
+                   error_model='numpy')(angle_wrap)
+
+class PropagationWorkspace(object):
+    '''
+        Class definition for a reusable ray bundle buffer. Sweeps which
+        propagate the same number of rays through the same number of
+        components can pass one workspace to propagate_rays instead of
+        allocating a new output for every call.
+    '''
+    def __init__(self, nrays, ncomponents, dtype=np.float32):
+        '''
+            Constructor for propagation workspace.
+
+            Inputs:
+                nrays: Number of rays
+                ncomponents: Number of components
+                dtype: Floating point type of the buffer
+
+            Outputs:
+                None.
+        '''
+        self.bundles = np.empty((3, nrays, ncomponents+1), dtype=dtype)
+
+    def reset(self, nrays, ncomponents, dtype=None):
+        '''
+            Function to get the buffer for a propagation. The buffer is only
+            reallocated if the size or type changed.
+
+            Inputs:
+                nrays: Number of rays
+                ncomponents: Number of components
+                dtype: Floating point type of the buffer. If None, the current
+                    type is kept
+
+            Outputs:
+                bundles: 3xNx(C+1) buffer
+        '''
+        if dtype is None:
+            dtype = self.bundles.dtype
+
+        shape = (3, nrays, ncomponents+1)
+        if self.bundles.shape != shape or self.bundles.dtype != dtype:
+            self.bundles = np.empty(shape, dtype=dtype)
+
+        return self.bundles
+
+class OpticalSystem(object):
+    '''
+        Class definition for a sequence of optical components. Quantities
+        which only depend on the components are computed once here and shared
+        by all the rays.
+    '''
+    def __init__(self, components, specialize=False):
+        '''
+            Constructor for optical system.
+
+            Inputs:
+                components: List of optical components, in the order rays
+                    hit them
+                specialize: If True and the system has only mirrors, rays
+                    are propagated with a kernel generated and compiled for
+                    this exact system. Compiling takes time, so this only
+                    pays off when the same system is used for many rays
+
+            Outputs:
+                None.
+        '''
+        self.components = list(components)
+        self.specialize = specialize
+
+        # Type of each component, -1 if there is no compiled kernel for it
+        self.kind_all = np.array([_KIND_CODES.get(getattr(component, 'type',
+                                                          None), -1)
+                                  for component in self.components],
+                                 dtype=np.int8)
+        self.mirror_only = bool(np.all(self.kind_all == KIND_MIRROR))
+
+        # Component parameters as contiguous arrays, so that propagation
+        # loops never touch the component objects
+        self.H_all = np.array([component._H_flat
+                               for component in self.components],
+                              dtype=np.float64).reshape(-1, 9)
+        self.Hinv_all = np.array([component._Hinv_flat
+                                  for component in self.components],
+                                 dtype=np.float64).reshape(-1, 9)
+        self.theta_all = np.array([component.theta
+                                   for component in self.components],
+                                  dtype=np.float64)
+        # Mirrors cache their deflection constant, other kinds have none
+        self.pi_minus_2theta_all = np.array(
+                            [component._pi_minus_2theta if kind == KIND_MIRROR
+                             else np.nan
+                             for component, kind in zip(self.components,
+                                                        self.kind_all)],
+                            dtype=np.float64)
+        self.half_aperture_all = np.array([component._half_aperture
+                                           for component in self.components],
+                                          dtype=np.float64)
+
+    def propagate(self, ray_bundles, lmb=None):
+        '''
+            Function to propagate rays through the system in place.
 
-    return angle
+            Inputs:
+                ray_bundles: 3xNx(C+1) array with the input rays in the first
+                    column. Remaining columns are filled with propagated rays
+                lmb: Wavelength. Only required for grating
+
+            Outputs:
+                None.
+        '''
+        dtype = ray_bundles.dtype
+
+        # Mirror-only systems go through a compiled kernel, optionally one
+        # generated for this system
+        if HAS_NUMBA and self.mirror_only and self.specialize:
+            _get_scene_kernel(self)(ray_bundles)
+            return
+
+        if HAS_NUMBA and self.mirror_only:
+            _propagate_kernel(ray_bundles,
+                              self.H_all.astype(dtype, copy=False),
+                              self.Hinv_all.astype(dtype, copy=False),
+                              self.theta_all.astype(dtype, copy=False),
+                              self.pi_minus_2theta_all.astype(dtype,
+                                                              copy=False),
+                              self.half_aperture_all.astype(dtype,
+                                                            copy=False),
+                              self.kind_all)
+            return
+
+        # Everything else goes through the components one at a time
+        for c_idx, component in enumerate(self.components):
+            ray_bundles[:, :, c_idx+1] = component.propagate(
+                                            ray_bundles[:, :, c_idx],
+                                            lmb)
 
 class OpticalObject(object):
     '''
@@ -100,71 +634,93 @@ class OpticalObject(object):
         self.aperture = aperture
         self.name = name
 
+        # Half aperture is what the intersection test needs
+        self._half_aperture = aperture*0.5
+
+        # Orientation does not change, so compute the trigonometry once
+        self._cos_theta = np.cos(theta)
+        self._sin_theta = np.sin(theta)
+
         # Create coordinate transformation matrix
-        self.H = self.create_xform()
-        self.Hinv = lin.inv(self.H)
+        self.H, self.Hinv = self.create_xform()
+
+        # Flattened copies for the compiled propagation kernels
+        self._H_flat = tuple(float(val) for val in self.H.ravel())
+        self._Hinv_flat = tuple(float(val) for val in self.Hinv.ravel())
+
+        # Single precision copies for propagating float32 rays
+        self._Hf32 = self.H.astype(np.float32)
+        self._Hinvf32 = self.Hinv.astype(np.float32)
 
     def get_intersection(self, orig, theta):
         '''
-            Method to get interesection of optical object plane and ray
+            Method to get interesection of optical object plane and rays
 
             Inputs:
-                orig: Origin of ray
-                theta: Orientation of ray w.r.t x-axis
+                orig: 2xN origins of rays
+                theta: N orientations of rays w.r.t x-axis
 
             Outputs:
-                dest: Destination of ray
+                dest: 3xN destination of rays. Last row is 1 if the ray hit
+                    the object and NaN otherwise
         '''
+        # Use matrices of the same precision as the rays
+        if theta.dtype == np.float32:
+            H, Hinv = self._Hf32, self._Hinvf32
+        else:
+            H, Hinv = self.H, self.Hinv
 
-        # If theta is nan, it means the ray terminated
-        if np.isnan(theta):
-            return np.ones((3,1))*float('nan')
-
-        # Transform ray origin to new coordinates
-        p = np.array([[orig[0]], [orig[1]], [1]], dtype=np.float64)
-
-        p_new = self.H.dot(p)
+        # Transform ray origins to new coordinates. A terminated ray (NaN
+        # angle) stays NaN through all the operations below
+        px = H[0, 0]*orig[0] + H[0, 1]*orig[1] + H[0, 2]
+        py = H[1, 0]*orig[0] + H[1, 1]*orig[1] + H[1, 2]
 
-        # Similarly find the angle in new coordinate system
+        # Similarly find the angles in new coordinate system
         theta_new = theta + self.theta
 
-        # Now compute the intersection
-        x_new_tf = 0
-        y_new_tf = p_new[1][0] - p_new[0][0]*np.tan(theta_new)
-
-        # Sanity check to see if the interesection lies within the aperture
-        if y_new_tf > self.aperture/2.0 or y_new_tf < -self.aperture/2.0:
-            flag = float('nan')
-        else:
-            flag = 1.0
+        # Now compute the intersection. The ray travels t = -x/cos along its
+        # direction to reach the object plane x=0
+        costheta = np.cos(theta_new)
+        sintheta = np.sin(theta_new)
+        y_new_tf = py - px*sintheta/costheta
 
-        p_tf = np.array([[x_new_tf], [y_new_tf], [1]])
+        # Go back to original system. x is zero on the object plane
+        p_final = np.empty((3, y_new_tf.shape[0]), dtype=y_new_tf.dtype)
+        p_final[0] = Hinv[0, 1]*y_new_tf + Hinv[0, 2]
+        p_final[1] = Hinv[1, 1]*y_new_tf + Hinv[1, 2]
 
-        # Go back to original system and return result
-        p_final = self.Hinv.dot(p_tf)
-        p_final[2] = flag
+        # Sanity check to see if the interesection lies within the aperture.
+        # The comparison is False for NaN, so terminated rays stay flagged
+        p_final[2] = np.where(np.abs(y_new_tf) <= self._half_aperture,
+                              1.0, np.nan)
 
         return p_final
 
-    def propagate(self, point, lmb=None):
+    def propagate(self, points, lmb=None):
         '''
-            Function to propagate a ray through the object. Requires an extra
+            Function to propagate rays through the object. Requires an extra
             definition for computing angles
 
             Inputs:
-                point: 3x1 vector with x-coordinate, y-coordinate and angle (rad)
+                points: 3xN array with x-coordinate, y-coordinate and angle
+                    (rad) of each ray. A single 3-vector is treated as 3x1.
+                    Single precision points are propagated in single
+                    precision, everything else in double precision
                 lmb: Wavelength. Only required for grating
             Outputs:
-                dest: 3x1 vector with x-coordinate, y-coordinate and angle (rad)
+                dest: 3xN array with x-coordinate, y-coordinate and angle (rad)
         '''
-        # First get intersection of the point with object plane
-        dest = self.get_intersection(point[:2], point[2])
+        points = np.asarray(points)
+        if points.dtype != np.float32:
+            points = points.astype(np.float64)
+        points = points.reshape(3, -1)
 
-        # Then compute angle
-        if np.isnan(dest[2]):
-            return dest
+        # First get intersection of the points with object plane
+        dest = self.get_intersection(points[:2], points[2])
 
-        dest[2] = self._get_angle(point, lmb, dest)
+        # Then compute angle. Rays which missed the object carry a NaN flag,
+        # which poisons their angle
+        dest[2] = dest[2]*self._get_angle(points, lmb, dest)
 
         return dest
 
@@ -177,25 +733,34 @@ class OpticalObject(object):
 
             Outputs:
                 H: 3D transformation matrix
+                Hinv: Inverse of H. Since H is a translation followed by a
+                    rotation, the inverse is computed in closed form
         '''
-        R = np.zeros((3, 3))
-        T = np.zeros((3, 3))
-
-        # Rotation
-        R[0, 0] = np.cos(self.theta)
-        R[0, 1] = -np.sin(self.theta)
-        R[1, 0] = np.sin(self.theta)
-        R[1, 1] = np.cos(self.theta)
-        R[2, 2] = 1
-
-        # Translation
-        T[0, 0] = 1
-        T[0, 2] = -self.pos[0]
-        T[1, 1] = 1
-        T[1, 2] = -self.pos[1]
-        T[2, 2] = 1
-
-        return R.dot(T)
+        costheta = self._cos_theta
+        sintheta = self._sin_theta
+
+        H = np.zeros((3, 3), dtype=np.float64)
+        Hinv = np.zeros((3, 3), dtype=np.float64)
+
+        # Rotation times translation
+        H[0, 0] = costheta
+        H[0, 1] = -sintheta
+        H[0, 2] = -self.pos[0]*costheta + self.pos[1]*sintheta
+        H[1, 0] = sintheta
+        H[1, 1] = costheta
+        H[1, 2] = -self.pos[0]*sintheta - self.pos[1]*costheta
+        H[2, 2] = 1
+
+        # Inverse translation times transposed rotation
+        Hinv[0, 0] = costheta
+        Hinv[0, 1] = sintheta
+        Hinv[0, 2] = self.pos[0]
+        Hinv[1, 0] = -sintheta
+        Hinv[1, 1] = costheta
+        Hinv[1, 2] = self.pos[1]
+        Hinv[2, 2] = 1
+
+        return H, Hinv
 
 class Mirror(OpticalObject):
     ''' Class definition for Mirror object'''
@@ -220,21 +785,23 @@ class Mirror(OpticalObject):
         # Extra parameters
         self.type = 'mirror'
 
+        # Constant used for every deflection
+        self._pi_minus_2theta = np.pi - 2.0*self.theta
+
     def _get_angle(self, point, lmb, dest):
         '''
             Function to compute angle after propagation through mirror.
 
             Inputs:
-                point: 3-tuple of x-coordinate, y-coordinate and angle (radians)
+                point: 3xN array of x-coordinate, y-coordinate and angle
+                    (radians)
                 lmb: Wavelength of ray, only needed for grating
 
             Outputs:
-                theta: Angle after propagation
+                theta: N angles after propagation
         '''
 
         # Next compute deflection angle
-        theta_dest = np.pi - point[2] - 2*self.theta
-
-        return angle_wrap(theta_dest)
+        return angle_wrap(self._pi_minus_2theta - point[2])
 
 
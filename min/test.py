@@ -1,23 +1,12 @@
 import raytracing as rt
 import visualize as vis
 import numpy as np
-import re
 
-pattern = re.compile('scanangle')
+with open('scanrule', 'r') as f:
+    rule = [line.rstrip('\n') for line in f if line.startswith('scanangle')]
 
-with open('scanrule','r') as f:
-        rulename=f.readlines()
-        rule=[]
-        for line in rulename:
-            m=pattern.match(line)
-            if m:
-                rule.append(line.strip('\n'))
-
-angle=[]
-for i in rule:
-    angle.append(int(i.split(':')[1]))
-
-f.closed
+angles = np.fromiter((int(line.split(':', 1)[1]) for line in rule),
+                     dtype=np.int32)
 
 components = []
 components.append(rt.Mirror(
@@ -29,17 +18,19 @@ components.append(rt.Mirror(
 			  aperture=300,
 			  pos=[300,0],
 			  theta=0))
-rays = []
-n1 = 180/float(angle[0])
-n2 = 180/float(angle[1])
-rays.append([75, 100, -(np.pi/2 - np.pi/n1)])
-rays.append([125, 100, -(np.pi/2 - np.pi/n2)])
+
+# One ray per scan angle, starting 50 units apart
+n = 180/angles.astype(np.float64)
+thetas = -(np.pi/2 - np.pi/n)
+rays = np.column_stack((75 + 50*np.arange(angles.size, dtype=np.float64),
+                        np.full_like(thetas, 100),
+                        thetas))
 ray_bundles = rt.propagate_rays(components, rays)
 
 
 
-# Color for the rays
-colors = ['r','b']
+# Color for the rays, alternating between red and blue
+colors = [['r', 'b'][idx % 2] for idx in range(angles.size)]
 
 # Create a new canvas
 canvas = vis.Canvas([-100, 300], [-100, 100])
@@ -2,7 +2,7 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib import lines
+from matplotlib.collections import LineCollection
 
 class Canvas(object):
     '''
@@ -48,55 +48,51 @@ class Canvas(object):
             Function to draw rays propagating through the system
 
             Inputs:
-                ray_bundles: List of rays for the components
+                ray_bundles: 3xNx(C+1) array of rays propagated through the
+                        components, as returned by propagate_rays. A list of
+                        3x(C+1) arrays, one per ray, is also accepted
                 colors: Color for each ray. If None, colors are randomly
                         generated
         '''
+        if not isinstance(ray_bundles, np.ndarray):
+            ray_bundles = np.stack(ray_bundles, axis=1)
+
+        nrays = ray_bundles.shape[1]
+
         if colors is None:
-            colors = [np.random.rand(3,1) for i in range(len(ray_bundles))]
+            colors = [np.random.rand(3) for i in range(nrays)]
 
         # Make sure number of rays and number of colors are same
-        if len(ray_bundles) != len(colors):
+        if nrays != len(colors):
             raise ValueError("Need same number of colors as rays")
 
-        for r_idx, ray_bundle in enumerate(ray_bundles):
-            # First N-1 points are easy to cover
-            for idx in range(ray_bundle.shape[1]-1):
-                if ray_bundle[0, idx] == float('nan'):
-                    break
-
-                xmin = ray_bundle[0, idx]
-                xmax = ray_bundle[0, idx+1]
-
-                ymin = ray_bundle[1, idx]
-                ymax = ray_bundle[1, idx+1]
-
-                line = lines.Line2D([xmin, xmax],
-                                    [ymin, ymax],
-                                    color=colors[r_idx],
-                                    linewidth=1.0)
-                self.axes.add_line(line)
-
-            # The last point has slope and starting point, so extend it till
-            # end of canvas
-            xmin = ray_bundle[0, -1]
-            ymin = ray_bundle[1, -1]
-
-            if xmin == float('nan'):
-                return
-
-            # Brute force by extending line by maximum distance
-            dist = np.hypot(self.xlim[1]-self.xlim[0],
-                            self.ylim[1]-self.ylim[0])
-            xmax = xmin + dist*np.cos(ray_bundle[2, idx+1])
-            ymax = ymin + dist*np.sin(ray_bundle[2, idx+1])
-
-            line = lines.Line2D([xmin, xmax],
-                                [ymin, ymax],
-                                color=colors[r_idx],
-                                linewidth=1.0)
-            self.axes.add_line(line)
-                
+        # The last point has slope and starting point, so extend it till end
+        # of canvas. Brute force by extending line by maximum distance
+        dist = float(np.hypot(self.xlim[1]-self.xlim[0],
+                              self.ylim[1]-self.ylim[0]))
+        xend = ray_bundles[0, :, -1] + dist*np.cos(ray_bundles[2, :, -1])
+        yend = ray_bundles[1, :, -1] + dist*np.sin(ray_bundles[2, :, -1])
+
+        # Nx(C+2)x2 points along each ray
+        points = np.stack((np.column_stack((ray_bundles[0], xend)),
+                           np.column_stack((ray_bundles[1], yend))), axis=-1)
+
+        # Consecutive points form the segments, Nx(C+1)x2x2
+        segments = np.stack((points[:, :-1], points[:, 1:]), axis=2)
+
+        # Terminated rays have NaN coordinates or angles, so only keep
+        # segments with both end points valid
+        valid = ~np.isnan(points).any(axis=-1)
+        mask = valid[:, :-1] & valid[:, 1:]
+
+        ray_indices = np.nonzero(mask)[0]
+        segment_colors = [colors[r_idx] for r_idx in ray_indices]
+
+        # Draw everything as a single collection
+        collection = LineCollection(segments[mask],
+                                    colors=segment_colors,
+                                    linewidths=1.0)
+        self.axes.add_collection(collection)
 
     def save(self, savename):
         '''